@@ -5,20 +5,52 @@ Client for interacting with the LOINC API to retrieve standardized medical termi
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+import hashlib
 import logging
-import json
-from typing import Dict, List, Any, Optional
+import os
+import orjson
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from urllib.parse import urljoin
 
+from .config import (
+    CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS,
+    DISK_CACHE_DIR, DISK_CACHE_TTL_SECONDS,
+    ENDPOINTS, SEARCH_ENDPOINTS,
+    HTTP_MAX_INFLIGHT, HTTP_MAX_RETRIES, HTTP_POOL_SIZE,
+    HTTP_RETRY_AFTER_MAX, HTTP_RETRY_BACKOFF, HTTP_RETRY_STATUSES, HTTP_TIMEOUT,
+)
+
 logger = logging.getLogger(__name__)
 
+def _copy_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a cached response so callers can modify it without changing what later callers get.
+    
+    Args:
+        result: Cached response
+        
+    Returns:
+        Shallow copy of the response, with its own 'results' list
+    """
+    copied = dict(result)
+    if isinstance(copied.get('results'), list):
+        copied['results'] = list(copied['results'])
+    return copied
+
 class LOINCAPI:
     """
     Client for the LOINC API, which provides access to standardized medical terminology.
     """
     
-    def __init__(self, username: str, password: str, base_url: str = "https://loinc.regenstrief.org/searchapi/"):
+    def __init__(self, username: str, password: str, base_url: str = "https://loinc.regenstrief.org/searchapi/",
+                 cache_size: int = CACHE_MAX_ENTRIES, cache_ttl: float = CACHE_TTL_SECONDS,
+                 disk_cache_dir: Optional[str] = DISK_CACHE_DIR):
         """
         Initialize the LOINC API client.
         
@@ -26,15 +58,208 @@ class LOINCAPI:
             username: LOINC username for authentication
             password: LOINC password for authentication
             base_url: Base URL for the LOINC API
+            cache_size: Maximum number of responses kept in the in-memory cache (0 disables caching)
+            cache_ttl: Number of seconds a cached response stays valid
+            disk_cache_dir: Directory for responses kept across restarts (None, the default, disables the disk cache)
         """
         self.username = username
         self.password = password
         self.base_url = base_url
         self.auth = HTTPBasicAuth(username, password)
         self.headers = {"Accept": "application/json"}
+        
+        # Full URL of every known endpoint, joined once instead of on every request
+        self._urls = {endpoint: urljoin(base_url, path) for endpoint, path in ENDPOINTS.items()}
+        
+        # Reuse one session so connections to the LOINC API are kept alive between calls
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers.update(self.headers)
+        # Retries are done by _get_with_retries rather than urllib3, so backoff sleeps never hold an in-flight slot
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # Bounds concurrent requests so nested detail fan-out cannot flood the API into throttling us
+        self._inflight = threading.BoundedSemaphore(HTTP_MAX_INFLIGHT)
+        
+        # Circuit breaker state: consecutive failures and the monotonic time until which calls fail fast
+        self._failures = 0
+        self._circuit_open_until = 0.0
+        self._circuit_lock = threading.Lock()
+        
+        # LRU cache of successful responses, keyed by (endpoint, params) -> (expiry, response)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Guards the cache, which is shared by the threads fetching panel and form details
+        self._cache_lock = threading.Lock()
+        
+        # Casing of the search parameters ("upper" or "lower"), learned from the first search with results
+        self._param_case: Optional[str] = None
+        
+        # Top 2000 response, kept for the lifetime of the client and on disk between restarts
+        self._top2000: Optional[Dict[str, Any]] = None
+        self.disk_cache_dir = disk_cache_dir
+        # Clients for different API servers can share a cache directory without reading each other's responses
+        self._disk_cache_suffix = hashlib.sha256(base_url.encode("utf-8")).hexdigest()[:16]
         logger.info(f"Initialized LOINC API client with base URL: {base_url}")
     
-    def _make_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def clear_cache(self) -> None:
+        """Drop every cached response, including the pinned Top 2000 list and its copy on disk."""
+        with self._cache_lock:
+            self._cache.clear()
+        self._top2000 = None
+        
+        path = self._disk_cache_path("top2000")
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove disk cache file {path}: {e}")
+    
+    def close(self) -> None:
+        """Close the HTTP session and its pooled connections."""
+        self.session.close()
+    
+    def __enter__(self) -> "LOINCAPI":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def _make_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                      no_cache: bool = False) -> Dict[str, Any]:
+        """
+        Make a request to the LOINC API, serving repeated requests from the response cache.
+        
+        Args:
+            endpoint: API endpoint to call
+            params: Query parameters for the request
+            no_cache: Whether to bypass the cache entirely (no lookup, no store)
+            
+        Returns:
+            JSON response from the API
+        """
+        cache_key = (endpoint, tuple(sorted(params.items())) if params else ())
+        
+        if not no_cache:
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                logger.debug("Cache hit for %s with params: %s", endpoint, params)
+                return _copy_response(cached)
+        
+        result = self._fetch(endpoint, params)
+        
+        # Only successful responses are cached so that transient errors are retried; the caller gets a copy
+        if not no_cache and "error" not in result:
+            self._set_cached(cache_key, result)
+            return _copy_response(result)
+        
+        return result
+    
+    def _get_cached(self, cache_key: Tuple) -> Optional[Dict[str, Any]]:
+        """
+        Look up a response in the cache, dropping it if it has expired.
+        
+        Args:
+            cache_key: Key built from the endpoint and query parameters
+            
+        Returns:
+            The cached response, or None if there is no valid entry
+        """
+        with self._cache_lock:
+            entry = self._cache.get(cache_key)
+            if entry is None:
+                return None
+            
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._cache[cache_key]
+                return None
+            
+            self._cache.move_to_end(cache_key)
+            return result
+    
+    def _set_cached(self, cache_key: Tuple, result: Dict[str, Any]) -> None:
+        """
+        Store a response in the cache, evicting the least recently used entries when full.
+        
+        Args:
+            cache_key: Key built from the endpoint and query parameters
+            result: Response to cache
+        """
+        if self.cache_size <= 0:
+            return
+        
+        with self._cache_lock:
+            self._cache[cache_key] = (time.monotonic() + self.cache_ttl, result)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    def _disk_cache_path(self, name: str) -> Optional[str]:
+        """
+        Get the file used to keep a response on disk.
+        
+        Args:
+            name: Name of the cached response
+            
+        Returns:
+            Path of the cache file, or None if the disk cache is disabled
+        """
+        if not self.disk_cache_dir:
+            return None
+        return os.path.join(self.disk_cache_dir, f"{name}-{self._disk_cache_suffix}.json")
+    
+    def _read_disk_cache(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a response from the disk cache if it is there and not older than DISK_CACHE_TTL_SECONDS.
+        
+        Args:
+            name: Name of the cached response
+            
+        Returns:
+            The cached response, or None if there is no valid entry
+        """
+        path = self._disk_cache_path(name)
+        if not path:
+            return None
+        
+        try:
+            if time.time() - os.path.getmtime(path) > DISK_CACHE_TTL_SECONDS:
+                return None
+            with open(path, 'rb') as file:
+                return orjson.loads(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.warning(f"Could not read disk cache file {path}: {e}")
+            return None
+    
+    def _write_disk_cache(self, name: str, result: Dict[str, Any]) -> None:
+        """
+        Write a response to the disk cache; failures only cost a refetch after the next restart.
+        
+        Args:
+            name: Name of the cached response
+            result: Response to keep
+        """
+        path = self._disk_cache_path(name)
+        if not path:
+            return
+        
+        try:
+            os.makedirs(self.disk_cache_dir, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial file
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as file:
+                file.write(orjson.dumps(result))
+            os.replace(temp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not write disk cache file {path}: {e}")
+    
+    def _fetch(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Make a request to the LOINC API using HTTP Basic Authentication.
         
@@ -45,69 +270,69 @@ class LOINCAPI:
         Returns:
             JSON response from the API
         """
-        url = urljoin(self.base_url, endpoint)
+        url = self._urls.get(endpoint) or urljoin(self.base_url, endpoint)
+        
+        # While the API keeps failing, answer immediately instead of waiting on more timeouts
+        if not self._circuit_allows():
+            logger.debug("Circuit open, skipping request to %s", url)
+            return {"error": "LOINC API is temporarily unavailable after repeated failures", "results": []}
         
         try:
-            # Ensure params are properly formatted as strings
-            formatted_params = {}
-            if params:
-                for key, value in params.items():
-                    formatted_params[key] = str(value)
+            logger.debug("Making request to %s with params: %s", url, params)
             
-            logger.debug(f"Making request to {url} with params: {formatted_params}")
-            prepared_url = requests.Request('GET', url, params=formatted_params).prepare().url
-            logger.info(f"Full URL with params would be: {prepared_url}")
+            # requests URL-encodes the params itself, so they are passed through as-is
+            response = self._get_with_retries(url, params)
+            # Per-request details are only logged at DEBUG level
+            logger.debug("Request URL: %s", response.request.url)
             
-            response = requests.get(url, auth=self.auth, headers=self.headers, params=formatted_params)
-            # Log detailed information about the request
-            logger.info(f"Request URL: {response.request.url}")
-            logger.info(f"Request headers: {response.request.headers}")
+            # Server errors and throttling that outlasted the retries count towards opening the circuit;
+            # other client errors mean the API itself is up
+            if response.status_code >= 500 or response.status_code == 429:
+                self._record_failure()
+            else:
+                self._record_success()
             
             # Check if there was an error and log more details
             if response.status_code != 200:
-                logger.error(f"Error response status code: {response.status_code}")
-                logger.error(f"Error response content: {response.text}")
+                logger.error("Error response status code: %s", response.status_code)
+                logger.error("Error response content: %s", response.text)
                 return {"error": f"HTTP error {response.status_code}: {response.reason}. Response: {response.text}"}
             
             # Log the raw response content for debugging
-            logger.info(f"Response status code: {response.status_code}")
-            logger.debug(f"Response content: {response.text[:1000]}...")  # Truncate long responses
+            logger.debug("Response status code: %s", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                # Decoding the body to text is only worth it when it is actually logged
+                logger.debug("Response content: %s...", response.text[:1000])  # Truncate long responses
             
-            # Parse the response as JSON
+            # Parse the response as JSON (orjson works on the raw bytes, skipping the text decode)
             try:
-                result = response.json()
+                result = orjson.loads(response.content)
                 
                 # Standardize LOINC API response to use lowercase 'results' key
                 # LOINC API uses 'Results' (capital R) in its response
-                standardized_result = {}
+                if isinstance(result, list):
+                    logger.debug("Response is a list, using it as results")
+                    return {"results": result}
                 
-                # Copy over any metadata or non-result keys
-                for key, value in result.items():
-                    if key != 'Results':
-                        standardized_result[key.lower()] = value
+                results = result.pop('Results', None)
+                if results is None:
+                    results = result.pop('results', None)
                 
-                # Handle the actual results - could be in 'Results' or somewhere else
-                if 'Results' in result:
-                    standardized_result['results'] = result['Results']
-                    logger.info(f"Found {len(result['Results'])} items in 'Results' key")
-                    return standardized_result
-                elif 'results' in result:
-                    standardized_result['results'] = result['results']
-                    return standardized_result
-                else:
+                # Copy over any metadata or non-result keys in a single pass
+                standardized_result = {key.lower(): value for key, value in result.items()}
+                
+                if results is None:
                     logger.warning(f"Response doesn't contain 'Results' or 'results' key. Keys found: {result.keys()}")
                     # Create a reasonable default
                     standardized_result['results'] = []
                     standardized_result['raw_response'] = result
-                    
-                    # If the response is a list, use it as results
-                    if isinstance(result, list):
-                        logger.info("Response is a list, using it as results")
-                        standardized_result['results'] = result
-                    
-                    return standardized_result
+                else:
+                    logger.debug("Found %d items in results", len(results))
+                    standardized_result['results'] = results
+                
+                return standardized_result
                 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.error("Response is not valid JSON")
                 logger.error(f"Raw response content: {response.text[:500]}...")
                 return {
@@ -118,47 +343,181 @@ class LOINCAPI:
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"Error making request to {url}: {e}")
+            self._record_failure()
             return {"error": str(e), "results": []}
+    
+    def _get_with_retries(self, url: str, params: Optional[Dict[str, Any]]) -> requests.Response:
+        """
+        Send a GET request, retrying failed connections and throttled or unavailable responses with backoff.
+        
+        Args:
+            url: URL to request
+            params: Query parameters for the request
+            
+        Returns:
+            The first response that is not retried, or the last one once the retries are used up
+        """
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            last_attempt = attempt == HTTP_MAX_RETRIES
+            try:
+                # Only the request itself holds an in-flight slot; the backoff sleeps below happen outside it
+                with self._inflight:
+                    response = self.session.get(url, params=params, timeout=HTTP_TIMEOUT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+                delay = HTTP_RETRY_BACKOFF * 2 ** attempt
+            else:
+                if last_attempt or response.status_code not in HTTP_RETRY_STATUSES:
+                    return response
+                delay = self._retry_delay(response, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            
+            logger.debug("Retrying %s in %.2fs (attempt %d of %d)", url, delay, attempt + 1, HTTP_MAX_RETRIES)
+            time.sleep(delay)
+    
+    @staticmethod
+    def _retry_delay(response: requests.Response, attempt: int) -> Optional[float]:
+        """
+        Work out how long to wait before retrying a throttled or unavailable response.
+        
+        Args:
+            response: Response that is going to be retried
+            attempt: Number of attempts already retried (0 for the first retry)
+            
+        Returns:
+            Seconds to wait: the server's Retry-After if it gives one, otherwise the exponential
+            backoff; None if the server asks for longer than HTTP_RETRY_AFTER_MAX and the
+            response should be returned without retrying
+        """
+        retry_after = response.headers.get("Retry-After", "").strip()
+        if retry_after.isdigit():
+            return float(retry_after) if int(retry_after) <= HTTP_RETRY_AFTER_MAX else None
+        return HTTP_RETRY_BACKOFF * 2 ** attempt
+    
+    def _circuit_allows(self) -> bool:
+        """
+        Check whether a request may be sent, letting a trial request through once the reset period is over.
+        
+        Returns:
+            True if the request may be sent, False while the circuit is open
+        """
+        with self._circuit_lock:
+            if self._failures < CIRCUIT_FAILURE_THRESHOLD:
+                return True
+            if time.monotonic() < self._circuit_open_until:
+                return False
+            # Half-open: one trial request; a failure reopens the circuit for another period
+            self._circuit_open_until = time.monotonic() + CIRCUIT_RESET_SECONDS
+            return True
+    
+    def _record_success(self) -> None:
+        """Close the circuit after a request reached the API."""
+        with self._circuit_lock:
+            if self._failures >= CIRCUIT_FAILURE_THRESHOLD:
+                logger.warning("LOINC API is reachable again, closing circuit")
+            self._failures = 0
+    
+    def _record_failure(self) -> None:
+        """Count a failed request, opening the circuit when the threshold is reached."""
+        with self._circuit_lock:
+            self._failures += 1
+            if self._failures == CIRCUIT_FAILURE_THRESHOLD:
+                self._circuit_open_until = time.monotonic() + CIRCUIT_RESET_SECONDS
+                logger.warning(
+                    f"LOINC API failed {self._failures} times in a row, failing fast for {CIRCUIT_RESET_SECONDS}s"
+                )
 
     
-    def search_loincs(self, query: str, limit: int = 20) -> Dict[str, Any]:
+    def search(self, kind: str, query: str, limit: int = 20) -> Dict[str, Any]:
         """
-        Search for LOINC codes matching a query.
+        Search one of the LOINC search endpoints.
         
         Args:
+            kind: Endpoint to search ("loincs", "parts", "groups", "forms" or "panels")
             query: Search term
             limit: Maximum number of results to return
+            
+        Returns:
+            Dictionary containing the matching items
+        """
+        if kind not in SEARCH_ENDPOINTS:
+            raise ValueError(f"Unsupported search kind: {kind}. Expected one of {', '.join(SEARCH_ENDPOINTS)}")
+        return self._search(kind, query, limit)
+    
+    def _search(self, endpoint: str, query: str, limit: int) -> Dict[str, Any]:
+        """
+        Run a query against a search endpoint, learning the parameter casing from the loincs endpoint.
         
+        Args:
+            endpoint: Search endpoint to call
+            query: Search term
+            limit: Maximum number of results to return
+            
         Returns:
-            Dictionary containing matching LOINC codes and their details
+            Dictionary containing the matching items
         """
-        logger.info(f"Searching for LOINC codes with query: '{query}', limit: {limit}")
+        logger.info("Searching %s with query: '%s', limit: %s", endpoint, query, limit)
         
-        # Try with Query parameter (official docs)
-        params = {
-            "Query": query,
-            "Limit": limit
-        }
+        # Once the casing accepted by the API is known, a single request is enough. Only loincs is probed:
+        # the other endpoints use the learned casing, or the upper-case default, with one request
+        if self._param_case is not None or endpoint != "loincs":
+            result = self._make_request(endpoint, self._search_params(query, limit))
+            logger.info("Returning %d results", len(result.get('results', [])))
+            return result
         
-        result = self._make_request("loincs", params)
+        # Try with Query parameter (official docs)
+        result = self._make_request(endpoint, self._search_params(query, limit, "upper"))
+        if "error" in result:
+            return result
         
-        # If empty results and no error, try with lowercase parameters as fallback
-        if "error" not in result and not result.get("results", []):
+        if result.get("results"):
+            self._param_case = "upper"
+        else:
+            # If empty results, try with lowercase parameters as fallback
             logger.info("No results found with capitalized parameters, trying lowercase")
-            lowercase_params = {
-                "query": query,
-                "limit": limit
-            }
-            lowercase_result = self._make_request("loincs", lowercase_params)
+            lowercase_result = self._make_request(endpoint, self._search_params(query, limit, "lower"))
             
-            # Use the lowercase result if it has results or if both have no results
-            if "results" in lowercase_result and (len(lowercase_result["results"]) > 0 or "error" in result):
-                logger.info(f"Lowercase parameters returned {len(lowercase_result.get('results', []))} results")
+            if lowercase_result.get("results"):
+                logger.info("Lowercase parameters returned %d results", len(lowercase_result['results']))
+                self._param_case = "lower"
                 return lowercase_result
         
-        logger.info(f"Returning {len(result.get('results', []))} results")
+        logger.info("Returning %d results", len(result.get('results', [])))
         return result
     
+    def search_loincs(self, query: str, limit: int = 20) -> Dict[str, Any]:
+        """
+        Search for LOINC codes matching a query.
+        
+        Args:
+            query: Search term
+            limit: Maximum number of results to return
+        
+        Returns:
+            Dictionary containing matching LOINC codes and their details
+        """
+        return self._search("loincs", query, limit)
+    
+    def _search_params(self, query: str, limit: int, case: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the query parameters for a search endpoint.
+        
+        Args:
+            query: Search term
+            limit: Maximum number of results to return
+            case: Parameter name casing to use ("upper" or "lower"); defaults to the learned casing
+            
+        Returns:
+            Dictionary of query parameters
+        """
+        case = case or self._param_case or "upper"
+        if case == "lower":
+            return {"query": query, "limit": limit}
+        return {"Query": query, "Limit": limit}
+    
     def get_answerlists(self, loinc_code: str) -> Dict[str, Any]:
         """
         Get standardized answer options for a specific LOINC code.
@@ -185,11 +544,7 @@ class LOINCAPI:
         Returns:
             Dictionary containing matching LOINC parts
         """
-        params = {
-            "Query": query,
-            "Limit": limit
-        }
-        return self._make_request("parts", params)
+        return self._search("parts", query, limit)
     
     def search_groups(self, query: str, limit: int = 20) -> Dict[str, Any]:
         """
@@ -202,11 +557,7 @@ class LOINCAPI:
         Returns:
             Dictionary containing matching LOINC groups
         """
-        params = {
-            "Query": query,
-            "Limit": limit
-        }
-        return self._make_request("groups", params)
+        return self._search("groups", query, limit)
     
     def get_multiaxial(self, parent: str = None, child: str = None) -> Dict[str, Any]:
         """
@@ -238,11 +589,7 @@ class LOINCAPI:
         Returns:
             Dictionary containing matching forms
         """
-        params = {
-            "Query": query,
-            "Limit": limit
-        }
-        return self._make_request("forms", params)
+        return self._search("forms", query, limit)
     
     def search_panels(self, query: str, limit: int = 20) -> Dict[str, Any]:
         """
@@ -255,11 +602,7 @@ class LOINCAPI:
         Returns:
             Dictionary containing matching panels
         """
-        params = {
-            "Query": query,
-            "Limit": limit
-        }
-        return self._make_request("panels", params)
+        return self._search("panels", query, limit)
     
     def get_top2000(self) -> Dict[str, Any]:
         """
@@ -268,4 +611,14 @@ class LOINCAPI:
         Returns:
             Dictionary containing the top 2000 LOINC codes
         """
-        return self._make_request("top2000")
+        # The Top 2000 list only changes with LOINC releases, so it is fetched once and kept on disk
+        if self._top2000 is None:
+            result = self._read_disk_cache("top2000")
+            if result is None:
+                result = self._make_request("top2000", no_cache=True)
+                if "error" in result:
+                    return result
+                self._write_disk_cache("top2000", result)
+            self._top2000 = result
+        
+        return _copy_response(self._top2000)
@@ -9,6 +9,44 @@ DEFAULT_LIMIT = 20
 DEFAULT_DATA_VERSION = "current"
 DEFAULT_FORMAT = "json"
 
+# In-memory response cache for the LOINC API client
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL_SECONDS = 3600
+
+# On-disk cache for responses that only change with LOINC releases (e.g. the Top 2000 list).
+# Off by default; enabled with the server's --cache-dir option or LOINCAPI(disk_cache_dir=...)
+DISK_CACHE_DIR = None
+DISK_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# Database files at least this large (in bytes) are streamed into memory instead of parsed in one go
+STREAMING_LOAD_THRESHOLD = 100 * 1024 * 1024
+
+# Number of distinct queries whose local database results are kept in memory
+SEARCH_CACHE_SIZE = 1024
+
+# Number of pooled HTTP connections kept open to the LOINC API
+HTTP_POOL_SIZE = 16
+
+# (connect, read) timeouts in seconds for requests to the LOINC API
+HTTP_TIMEOUT = (3.05, 30)
+
+# Retries for failed connections and throttled or unavailable responses, with exponential backoff
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.2
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest Retry-After (in seconds) that is waited out; a throttled response asking for more is returned as is
+HTTP_RETRY_AFTER_MAX = 1
+
+# Maximum number of requests in flight to the LOINC API at once, across all threads
+HTTP_MAX_INFLIGHT = 16
+
+# Circuit breaker: after this many consecutive failed requests, calls fail fast for CIRCUIT_RESET_SECONDS
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+
+# Number of concurrent API requests used to fetch panel component and form details
+DETAIL_FETCH_WORKERS = 8
+
 # Base URL for the LOINC API
 BASE_URL = "https://loinc.regenstrief.org/searchapi/"
 
@@ -23,3 +61,6 @@ ENDPOINTS = {
     "panels": "panels",
     "top2000": "top2000"
 }
+
+# LOINC API endpoints that accept a free-text query
+SEARCH_ENDPOINTS = ("loincs", "parts", "groups", "forms", "panels")
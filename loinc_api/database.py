@@ -5,29 +5,112 @@ Utilities for working with local LOINC database files.
 """
 
 import os
+import sys
 import csv
 import logging
-import json
-from typing import Dict, List, Any, Optional
+import functools
+import bisect
+import itertools
+import pickle
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+
+import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional; CSV files are then read with the csv module
+    pa = None
+    pc = None
+    pa_csv = None
+
+try:
+    import ijson
+except ImportError:  # ijson is optional; large JSON files are then parsed in one go
+    ijson = None
+
+from .config import SEARCH_CACHE_SIZE, STREAMING_LOAD_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
+class _Missing:
+    """Marks a field that is absent from a JSON record (as opposed to present with a null value)."""
+    
+    def __reduce__(self) -> str:
+        # Unpickle to the module-level singleton so identity checks survive the index file
+        return '_MISSING'
+    
+    def __repr__(self) -> str:
+        return '<missing>'
+
+_MISSING = _Missing()
+
+# Bumped whenever the layout of the persisted index changes, so stale index files are rebuilt
+_INDEX_FORMAT_VERSION = 3
+
+class _IndexUnpickler(pickle.Unpickler):
+    """Unpickler for the index file that refuses every global except the few the index is made of."""
+    
+    _ALLOWED_GLOBALS = {('array', '_array_reconstructor'), ('array', 'array'), (__name__, '_MISSING')}
+    
+    def find_class(self, module: str, name: str) -> Any:
+        # Anything else could name an arbitrary callable, so a tampered index file cannot run code on load
+        if (module, name) not in self._ALLOWED_GLOBALS:
+            raise pickle.UnpicklingError(f"Unexpected global in index file: {module}.{name}")
+        return super().find_class(module, name)
+
+# Joins the lowercase fields of a record into one searchable string; never part of a real query
+_FIELD_SEPARATOR = '\x00'
+
 class LOINCDatabase:
     """
     Handler for local LOINC database files.
     Provides methods to load and query LOINC data from a local CSV or JSON file.
     """
     
-    def __init__(self, database_path: str):
+    # Low-cardinality fields whose values are shared across many records
+    _INTERN_COLUMNS = ('CLASS', 'PROPERTY', 'SYSTEM', 'SCALE_TYP', 'STATUS')
+    
+    # Attributes persisted in the index file, in the order they are written
+    _INDEX_ATTRIBUTES = ('_columns', '_size', '_row_text', '_field_offsets', '_by_code', '_class_index', '_trigram_index')
+    
+    def __init__(self, database_path: str, use_index_file: bool = False):
         """
         Initialize the LOINC database handler.
         
         Args:
             database_path: Path to the LOINC database file (CSV or JSON)
+            use_index_file: Whether to save the parsed data and indexes next to the database file and
+                reuse them on later loads; only enable it where nobody else can write that directory
         """
         self.database_path = database_path
-        self.data = []
+        self.index_path = f"{database_path}.idx" if use_index_file else None
         self.loaded = False
+        
+        # Column-oriented storage: one list of values per field, all of the same length
+        self._columns: Dict[str, List[Any]] = {}
+        self._size = 0
+        
+        # Lowercase text of every record, its fields joined by _FIELD_SEPARATOR (empty where the record
+        # lacks the field), so searches skip str()/lower(). This is the only lowercase copy of the data:
+        # a single field is sliced back out using the offsets, len(columns) + 1 per record, where entry
+        # k is the start of field k and the last one is one past the end of the text
+        self._row_text: List[str] = []
+        self._field_offsets = array('I')
+        self._field_positions: Dict[str, int] = {}
+        
+        # Lookup structures built once the data is loaded
+        self._by_code: Dict[str, int] = {}
+        self._class_index: Dict[str, List[int]] = {}
+        self._panels: List[Dict[str, Any]] = []
+        # Ascending positions per trigram, stored as 4-byte unsigned ints rather than 8-byte list references
+        self._trigram_index: Dict[str, array] = {}
+        
+        # Per-instance LRU of search results, cleared whenever the data is reloaded
+        self._search_cached = functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)(self._search_uncached)
         self.file_type = os.path.splitext(database_path)[1].lower()
         
         logger.info(f"Initializing LOINC database handler with file: {database_path}")
@@ -39,38 +122,342 @@ class LOINCDatabase:
         Returns:
             True if successful, False otherwise
         """
+        # Loading is done once; later calls are no-ops
+        if self.loaded:
+            return True
+        
         if not os.path.exists(self.database_path):
             logger.error(f"Database file not found: {self.database_path}")
             return False
             
         try:
-            if self.file_type == '.csv':
-                self._load_csv()
-            elif self.file_type == '.json':
-                self._load_json()
-            else:
+            if self.file_type not in ('.csv', '.json'):
                 logger.error(f"Unsupported file type: {self.file_type}")
                 return False
+            
+            # Taken before parsing, so the saved index describes the file as it was when it was read
+            signature = self._index_signature() if self.index_path else None
+            if self._load_index_file(signature):
+                logger.info(f"Loaded prebuilt index from {self.index_path}")
+            else:
+                if self.file_type == '.csv':
+                    self._load_csv()
+                else:
+                    self._load_json()
                 
+                self._intern_columns()
+                self._build_indexes()
+                self._save_index_file(signature)
+            
+            self._build_views()
             self.loaded = True
-            logger.info(f"Successfully loaded {len(self.data)} LOINC records")
+            logger.info(f"Successfully loaded {self._size} LOINC records")
             return True
         except Exception as e:
             logger.exception(f"Error loading database: {e}")
             return False
     
+    def _ensure_loaded(self) -> None:
+        """Load the database on first use, raising RuntimeError if it cannot be loaded."""
+        if not self.loaded and not self.load_database():
+            raise RuntimeError(f"LOINC database could not be loaded: {self.database_path}")
+    
     def _load_csv(self) -> None:
         """Load LOINC data from a CSV file."""
-        with open(self.database_path, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            self.data = list(reader)
+        columns = self._read_csv_columns() if pa_csv is not None else None
+        if columns is not None:
+            self._set_columns(columns)
+            return
+        
+        # utf-8-sig drops a leading byte order mark, as pyarrow does, so the first column name is the same on both paths
+        with open(self.database_path, 'r', encoding='utf-8-sig') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            # DictReader skips blank lines too
+            rows = [row for row in reader if row]
+        
+        if len(set(header)) == len(header) and all(len(row) == len(header) for row in rows):
+            # Well-formed file: transpose the rows into columns without building a dict per row
+            self._set_columns({name: list(values) for name, values in zip(header, zip(*rows))})
+            return
+        
+        # Ragged rows or duplicate column names: keep DictReader's handling of them
+        with open(self.database_path, 'r', encoding='utf-8-sig') as file:
+            self._set_records(csv.DictReader(file))
+    
+    def _read_csv_columns(self) -> Optional[Dict[str, List[str]]]:
+        """
+        Parse the CSV file with pyarrow's multi-threaded C++ reader.
+        
+        Returns:
+            Dictionary mapping each column name to its values, or None if pyarrow
+            cannot represent the file and the csv module has to read it instead
+        """
+        # Opened exactly as the csv-module path opens the file, so both agree on the column names
+        with open(self.database_path, 'r', encoding='utf-8-sig') as file:
+            header = next(csv.reader(file), [])
+        
+        # pyarrow rejects empty files and cannot address duplicate column names by name
+        if not header or len(set(header)) != len(header):
+            return None
+        
+        # Force every column to string so values match what csv.DictReader returns
+        parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+        convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in header})
+        
+        try:
+            if not self._is_large_file():
+                table = pa_csv.read_csv(self.database_path, parse_options=parse_options, convert_options=convert_options)
+                return {name: self._arrow_text(table.column(name)) for name in table.column_names}
+            
+            # Large files are converted batch by batch so the whole Arrow table is never held in memory
+            logger.info("Streaming large CSV database in batches")
+            reader = pa_csv.open_csv(self.database_path, parse_options=parse_options, convert_options=convert_options)
+            columns: Dict[str, List[str]] = {name: [] for name in reader.schema.names}
+            for batch in reader:
+                for name, array in zip(batch.schema.names, batch.columns):
+                    columns[name].extend(self._arrow_text(array))
+            return columns
+        except pa.ArrowInvalid as e:
+            # Typically rows with more or fewer fields than the header, which csv.DictReader tolerates
+            logger.info(f"pyarrow could not parse {self.database_path} ({e}), falling back to the csv module")
+            return None
+    
+    @staticmethod
+    def _arrow_text(array: Any) -> List[str]:
+        """
+        Convert an Arrow string column to Python strings, with line breaks translated as text-mode open() does.
+        
+        Args:
+            array: Arrow string array or chunked array
+            
+        Returns:
+            Values of the column, with "\r\n" and "\r" inside quoted values turned into "\n"
+        """
+        # Most columns never contain a carriage return, so only those that do pay for the rewrite
+        if pc.any(pc.match_substring(array, '\r')).as_py():
+            array = pc.replace_substring_regex(array, '\r\n?', '\n')
+        return array.to_pylist()
     
     def _load_json(self) -> None:
         """Load LOINC data from a JSON file."""
-        with open(self.database_path, 'r', encoding='utf-8') as file:
-            self.data = json.load(file)
+        if ijson is not None and self._is_large_file():
+            # Stream the records into the columns without materializing the whole list first
+            logger.info("Streaming large JSON database with ijson")
+            with open(self.database_path, 'rb') as file:
+                self._set_records(ijson.items(file, 'item', use_float=True))
+            return
+        
+        # orjson parses straight from the raw bytes
+        with open(self.database_path, 'rb') as file:
+            self._set_records(orjson.loads(file.read()))
+    
+    def _is_large_file(self) -> bool:
+        """Check whether the database file is big enough to be loaded in streaming mode."""
+        return os.path.getsize(self.database_path) >= STREAMING_LOAD_THRESHOLD
+    
+    def _set_columns(self, columns: Dict[str, List[Any]]) -> None:
+        """
+        Store already column-oriented data.
+        
+        Args:
+            columns: Dictionary mapping each field name to its values, one per record
+        """
+        self._columns = columns
+        self._size = len(next(iter(columns.values()), []))
+    
+    def _set_records(self, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Convert records into column-oriented storage.
+        
+        Args:
+            records: LOINC records as dictionaries; fields may differ between records
+        """
+        columns: Dict[str, List[Any]] = {}
+        size = 0
+        
+        for record in records:
+            for name, value in record.items():
+                column = columns.get(name)
+                if column is None:
+                    # First record with this field: the earlier records do not have it
+                    column = columns[name] = [_MISSING] * size
+                column.append(value)
+            size += 1
+            
+            # Pad the fields this record does not have
+            if len(record) < len(columns):
+                for column in columns.values():
+                    if len(column) < size:
+                        column.append(_MISSING)
+        
+        self._columns = columns
+        self._size = size
+    
+    def _intern_columns(self) -> None:
+        """Intern the values of low-cardinality fields so records share one string object per value."""
+        for name in self._INTERN_COLUMNS:
+            column = self._columns.get(name)
+            if column is not None:
+                column[:] = [sys.intern(value) if type(value) is str else value for value in column]
+    
+    def _row(self, i: int) -> Dict[str, Any]:
+        """
+        Build the record at a given position as a dictionary.
+        
+        Args:
+            i: Position of the record
+            
+        Returns:
+            The LOINC record with the fields it actually has
+        """
+        return {name: column[i] for name, column in self._columns.items() if column[i] is not _MISSING}
+    
+    def _build_indexes(self) -> None:
+        """Build the joined row text and its field offsets, the LOINC code hash index, the per-class record index and the trigram index."""
+        self._by_code = {}
+        self._class_index = {}
+        trigram_index = defaultdict(functools.partial(array, 'I'))
+        
+        # Keep the first record for a code, as the previous linear scan did
+        for i, code in enumerate(self._columns.get('LOINC_NUM', ())):
+            if code is not _MISSING:
+                self._by_code.setdefault(code, i)
+        
+        for i, loinc_class in enumerate(self._columns.get('CLASS', ())):
+            if loinc_class is not _MISSING:
+                self._class_index.setdefault(loinc_class, []).append(i)
+        
+        row_text = []
+        field_offsets = array('I')
+        # Bound to locals since this loop runs once per record
+        append_row_text = row_text.append
+        extend_offsets = field_offsets.extend
+        join_fields = _FIELD_SEPARATOR.join
+        accumulate = itertools.accumulate
+        for i, values in enumerate(zip(*self._columns.values())):
+            texts = ['' if value is _MISSING else str(value).lower() for value in values]
+            append_row_text(join_fields(texts))
+            # Each field is followed by one separator, so the starts are the running sums of len + 1
+            extend_offsets(accumulate((len(text) + 1 for text in texts), initial=0))
+            
+            # Every lowercase trigram occurring in any field of the record, collected in one set comprehension
+            trigrams = {text[j:j + 3] for text in texts for j in range(len(text) - 2)}
+            for trigram in trigrams:
+                trigram_index[trigram].append(i)
+        
+        self._row_text = row_text
+        self._field_offsets = field_offsets
+        self._trigram_index = dict(trigram_index)
+    
+    def _build_views(self) -> None:
+        """Build the structures derived cheaply from the indexes, which are not persisted."""
+        self._field_positions = {name: k for k, name in enumerate(self._columns)}
+        self._panels = [self._row(i) for i in self._class_index.get('PANEL', [])]
+        self._search_cached.cache_clear()
+    
+    def _index_signature(self) -> Dict[str, Any]:
+        """
+        Describe the database file the persisted index was built from.
+        
+        Returns:
+            Format version, size and modification time of the database file
+        """
+        stat = os.stat(self.database_path)
+        return {'version': _INDEX_FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
     
-    def search(self, query: str, fields: Optional[List[str]] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    def _load_index_file(self, signature: Dict[str, Any]) -> bool:
+        """
+        Restore the columns and indexes from the index file if it matches the database file.
+        
+        Args:
+            signature: Signature of the database file, from _index_signature
+            
+        Returns:
+            True if the index file was used, False if the database file has to be parsed
+        """
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        
+        try:
+            with open(self.index_path, 'rb') as file:
+                # The signature is pickled separately so a stale index is rejected without reading the rest
+                if _IndexUnpickler(file).load() != signature:
+                    logger.info(f"Index file {self.index_path} is out of date, rebuilding it")
+                    return False
+                # One pickle per attribute, so the unpickler memo never spans the whole index
+                state = {name: _IndexUnpickler(file).load() for name in self._INDEX_ATTRIBUTES}
+        except Exception as e:
+            logger.warning(f"Could not read index file {self.index_path}: {e}")
+            return False
+        
+        for name, value in state.items():
+            setattr(self, name, value)
+        return True
+    
+    def _save_index_file(self, signature: Dict[str, Any]) -> None:
+        """
+        Persist the columns and indexes next to the database file so the next start skips parsing.
+        
+        Args:
+            signature: Signature of the database file taken before it was parsed, so a file
+                replaced during the parse leaves an index that is rejected as out of date
+        """
+        if not self.index_path:
+            return
+        
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            # Write to a temporary file first so a crash never leaves a truncated index behind
+            with open(temp_path, 'wb') as file:
+                pickle.dump(signature, file, protocol=pickle.HIGHEST_PROTOCOL)
+                for name in self._INDEX_ATTRIBUTES:
+                    pickle.dump(getattr(self, name), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.index_path)
+        except Exception as e:
+            # A read-only data directory only costs the next start a full parse
+            logger.warning(f"Could not write index file {self.index_path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    
+    def _candidate_positions(self, query: str) -> Optional[List[int]]:
+        """
+        Narrow a search down to the records containing every trigram of the query.
+        
+        Args:
+            query: Search term (lowercase)
+            
+        Returns:
+            Sorted positions of the candidate records, or None if the query is
+            too short to use the index and every record has to be scanned
+        """
+        if len(query) < 3:
+            return None
+        
+        postings = []
+        for trigram in {query[j:j + 3] for j in range(len(query) - 2)}:
+            posting = self._trigram_index.get(trigram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        
+        # Intersect starting from the rarest trigram; postings are sorted, so each remaining candidate
+        # is looked up by bisection instead of turning the longer postings into sets
+        postings.sort(key=len)
+        candidates = list(postings[0])
+        for posting in postings[1:]:
+            size = len(posting)
+            candidates = [i for i in candidates
+                          if (j := bisect.bisect_left(posting, i)) < size and posting[j] == i]
+            if not candidates:
+                break
+        
+        return candidates
+    
+    def search(self, query: str, fields: Optional[List[str]] = None, limit: int = 20,
+               filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
         """
         Search for LOINC codes matching the query in specified fields.
         
@@ -78,49 +465,132 @@ class LOINCDatabase:
             query: Search term
             fields: List of fields to search in (if None, searches all fields)
             limit: Maximum number of results to return
+            filters: Field values the records must contain (case-insensitive), e.g. {"SYSTEM": "Bld"}
             
         Returns:
             List of matching LOINC records
         """
-        if not self.loaded:
-            if not self.load_database():
-                return []
+        self._ensure_loaded()
+        
+        filter_items = tuple(sorted((field, value.lower()) for field, value in filters.items())) if filters else ()
         
-        query = query.lower()
+        # Repeated queries are answered from the LRU; callers get their own copies, so the cached records stay intact
+        cached = self._search_cached(query.lower(), tuple(fields) if fields else None, limit, filter_items)
+        return [dict(record) for record in cached]
+    
+    def _search_uncached(self, query: str, fields: Optional[Tuple[str, ...]], limit: int,
+                         filters: Tuple[Tuple[str, str], ...] = ()) -> Tuple[Dict[str, Any], ...]:
+        """
+        Scan the candidate records for the query.
+        
+        Args:
+            query: Search term (lowercase)
+            fields: Fields to search in (if None, searches all fields)
+            limit: Maximum number of results to return
+            filters: (field, lowercase value) pairs the records must contain
+            
+        Returns:
+            Tuple of matching LOINC records
+        """
         results = []
         
-        for record in self.data:
-            if self._matches_query(record, query, fields):
-                results.append(record)
+        # Candidates from the trigram index still need the full substring check
+        positions = self._candidate_positions(query)
+        
+        # A CLASS filter restricts the scan to the matching class buckets; keep whichever candidate list is shorter
+        class_positions = self._class_positions(filters)
+        if class_positions is not None:
+            positions = class_positions if positions is None else min(positions, class_positions, key=len)
+        
+        if positions is None:
+            positions = range(self._size)
+        
+        for i in positions:
+            # Filters are checked first so that limit counts only records that pass them
+            if self._matches_filters(i, filters) and self._matches_query(i, query, fields):
+                results.append(self._row(i))
                 if len(results) >= limit:
                     break
                     
-        return results
+        return tuple(results)
+    
+    def _class_positions(self, filters: Tuple[Tuple[str, str], ...]) -> Optional[List[int]]:
+        """
+        Collect the records whose class passes the CLASS filter, using the per-class index.
+        
+        Args:
+            filters: (field, lowercase value) pairs
+            
+        Returns:
+            Sorted positions of the candidate records, or None if there is no CLASS filter
+        """
+        class_filter = dict(filters).get('CLASS')
+        if class_filter is None:
+            return None
+        
+        buckets = [
+            positions for loinc_class, positions in self._class_index.items()
+            if class_filter in str(loinc_class).lower()
+        ]
+        if len(buckets) == 1:
+            return buckets[0]
+        return sorted(itertools.chain.from_iterable(buckets))
+    
+    def _matches_filters(self, i: int, filters: Tuple[Tuple[str, str], ...]) -> bool:
+        """
+        Check if a record contains every filter value in the corresponding field.
+        
+        Args:
+            i: Position of the LOINC record to check
+            filters: (field, lowercase value) pairs
+            
+        Returns:
+            True if the record passes all filters, False otherwise
+        """
+        for field, value in filters:
+            text = self._field_text(i, field)
+            if text is None or value not in text:
+                return False
+        return True
     
-    def _matches_query(self, record: Dict[str, Any], query: str, fields: Optional[List[str]]) -> bool:
+    def _matches_query(self, i: int, query: str, fields: Optional[List[str]]) -> bool:
         """
         Check if a record matches the query in any of the specified fields.
         
         Args:
-            record: LOINC record to check
+            i: Position of the LOINC record to check
             query: Search term (lowercase)
             fields: List of fields to search in (if None, searches all fields)
             
         Returns:
             True if the record matches, False otherwise
         """
-        if fields:
-            # Search only in specified fields
-            for field in fields:
-                if field in record and query in str(record[field]).lower():
-                    return True
-        else:
-            # Search in all fields
-            for value in record.values():
-                if query in str(value).lower():
-                    return True
-                    
-        return False
+        if not fields:
+            # Search in all fields with a single substring test on the joined record text
+            return query in self._row_text[i]
+        
+        # Search only in specified fields; any() stops at the first matching field
+        return any(
+            (text := self._field_text(i, field)) is not None and query in text
+            for field in fields
+        )
+    
+    def _field_text(self, i: int, field: str) -> Optional[str]:
+        """
+        Slice the lowercase text of one field out of a record's joined text.
+        
+        Args:
+            i: Position of the LOINC record
+            field: Name of the field
+            
+        Returns:
+            Lowercase text of the field, or None if the record lacks it
+        """
+        k = self._field_positions.get(field)
+        if k is None or self._columns[field][i] is _MISSING:
+            return None
+        offset = i * (len(self._field_positions) + 1) + k
+        return self._row_text[i][self._field_offsets[offset]:self._field_offsets[offset + 1] - 1]
     
     def get_by_loinc_code(self, loinc_code: str) -> Optional[Dict[str, Any]]:
         """
@@ -132,15 +602,25 @@ class LOINCDatabase:
         Returns:
             LOINC record if found, None otherwise
         """
-        if not self.loaded:
-            if not self.load_database():
-                return None
+        self._ensure_loaded()
         
-        for record in self.data:
-            if record.get('LOINC_NUM') == loinc_code:
-                return record
-                
-        return None
+        i = self._by_code.get(loinc_code)
+        return None if i is None else self._row(i)
+    
+    def get_many_by_code(self, loinc_codes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get several LOINC records by their codes in one pass over the code index.
+        
+        Args:
+            loinc_codes: LOINC codes to find
+            
+        Returns:
+            Dictionary mapping each code found to its LOINC record; unknown codes are omitted
+        """
+        self._ensure_loaded()
+        
+        by_code = self._by_code
+        return {code: self._row(by_code[code]) for code in loinc_codes if code in by_code}
     
     def get_panels(self) -> List[Dict[str, Any]]:
         """
@@ -149,11 +629,33 @@ class LOINCDatabase:
         Returns:
             List of LOINC panel records
         """
-        if not self.loaded:
-            if not self.load_database():
-                return []
+        self._ensure_loaded()
+        
+        return [dict(panel) for panel in self._panels]
+    
+    def find_panels_by_name(self, panel_name: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Find the panels whose long common name contains the given name.
+        
+        Args:
+            panel_name: Panel name to look for (case-insensitive)
+            limit: Maximum number of panels to return
+            
+        Returns:
+            List of matching LOINC panel records (CLASS exactly "PANEL"), in file order
+        """
+        self._ensure_loaded()
         
-        return [record for record in self.data if record.get('CLASS') == 'PANEL']
+        # Only the PANEL class bucket is scanned, unlike a CLASS filter, which also matches PANEL.CHEM etc.
+        name = panel_name.lower()
+        results = []
+        for i in self._class_index.get('PANEL', ()):
+            text = self._field_text(i, 'LONG_COMMON_NAME')
+            if text is not None and name in text:
+                results.append(self._row(i))
+                if len(results) >= limit:
+                    break
+        return results
     
     def get_top_loinc_codes(self, limit: int = 100) -> List[Dict[str, Any]]:
         """
@@ -165,10 +667,8 @@ class LOINCDatabase:
         Returns:
             List of top LOINC records
         """
-        if not self.loaded:
-            if not self.load_database():
-                return []
+        self._ensure_loaded()
         
         # This is a placeholder - in a real implementation, you'd need actual usage statistics
         # For now, we'll just return the first N records
-        return self.data[:limit]
+        return [self._row(i) for i in range(self._size)[:limit]]
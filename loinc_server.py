@@ -10,12 +10,13 @@ import argparse
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Any
 
 from mcp.server.fastmcp import FastMCP
 from loinc_api.api import LOINCAPI
 from loinc_api.database import LOINCDatabase
-from loinc_api.config import DEFAULT_LIMIT, DEFAULT_DATA_VERSION
+from loinc_api.config import DEFAULT_LIMIT, DEFAULT_DATA_VERSION, DETAIL_FETCH_WORKERS
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
@@ -32,6 +33,10 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument("--username", required=True, help="LOINC username")
     parser.add_argument("--password", required=True, help="LOINC password")
     parser.add_argument("--database-file", default="loinc_database.json", help="Path to LOINC database file (CSV or JSON)")
+    parser.add_argument("--index-file", action="store_true",
+                        help="Save the parsed database to <database file>.idx and reuse it on later starts")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory for API responses kept across restarts, such as the Top 2000 list (off if omitted)")
     return parser.parse_args()
 
 
@@ -63,38 +68,39 @@ def print_file_info(db_path: str) -> None:
     logger.info(f"Current working directory: {os.getcwd()}")
 
 
-def initialize_loinc_database(db_path: str) -> LOINCDatabase:
+def initialize_loinc_database(db_path: str, use_index_file: bool = False) -> LOINCDatabase:
     """
     Initialize the LOINC database.
     Args:
         db_path: Absolute path to the database file.
+        use_index_file: Whether to save and reuse the parsed database next to the database file.
     Returns:
         An initialized LOINCDatabase instance.
     """
     try:
-        loinc_db = LOINCDatabase(db_path)
-        success = loinc_db.load_database()
-        if success:
-            logger.info("LOINC database initialized successfully")
-        else:
-            logger.warning("LOINC database initialization failed, falling back to API-only mode")
+        loinc_db = LOINCDatabase(db_path, use_index_file=use_index_file)
+        # A database file that exists but cannot be loaded is a startup error, not a reason to degrade
+        if not loinc_db.load_database():
+            raise RuntimeError(f"Failed to load LOINC database: {db_path}")
+        logger.info("LOINC database initialized successfully")
         return loinc_db
     except Exception as e:
         logger.exception("Error initializing LOINC database")
         raise e
 
 
-def initialize_loinc_api(username: str, password: str) -> LOINCAPI:
+def initialize_loinc_api(username: str, password: str, cache_dir: Optional[str] = None) -> LOINCAPI:
     """
     Initialize the LOINC API with HTTP Basic Authentication.
     Args:
         username: LOINC username.
         password: LOINC password.
+        cache_dir: Directory for API responses kept across restarts (None disables the disk cache).
     Returns:
         An initialized LOINCAPI instance.
     """
     try:
-        loinc_api = LOINCAPI(username, password)
+        loinc_api = LOINCAPI(username, password, disk_cache_dir=os.path.expanduser(cache_dir) if cache_dir else None)
         logger.info("LOINC API initialized successfully")
         return loinc_api
     except Exception as e:
@@ -164,21 +170,8 @@ def search_loinc_codes(
         if class_filter:
             filter_conditions["CLASS"] = class_filter
         
-        # Search in the local database
-        local_results = loinc_database.search(query, limit=limit)
-        
-        # Apply additional filters
-        if filter_conditions:
-            filtered_results = []
-            for result in local_results:
-                matches_all_filters = True
-                for field, value in filter_conditions.items():
-                    if field in result and value.lower() not in result[field].lower():
-                        matches_all_filters = False
-                        break
-                if matches_all_filters:
-                    filtered_results.append(result)
-            local_results = filtered_results
+        # Search in the local database, applying the filters during the scan
+        local_results = loinc_database.search(query, limit=limit, filters=filter_conditions)
         
         if local_results:
             logger.info(f"Found {len(local_results)} results in local database")
@@ -235,17 +228,17 @@ def search_loinc_codes(
     
     # If not including details, strip down the results
     if not include_details and results:
-        simplified_results = []
-        for result in results:
-            simplified_result = {
+        # A dict literal per result is cheaper than a key-mapping loop; the comprehension avoids append calls
+        response["results"] = [
+            {
                 "loinc_code": result.get("LOINC_NUM", ""),
                 "long_common_name": result.get("LONG_COMMON_NAME", ""),
                 "component": result.get("COMPONENT", ""),
                 "property": result.get("PROPERTY", ""),
                 "system": result.get("SYSTEM", "")
             }
-            simplified_results.append(simplified_result)
-        response["results"] = simplified_results
+            for result in results
+        ]
     
     return response
 
@@ -287,7 +280,6 @@ def get_loinc_details(
         logger.info("Searching using LOINC API")
         
         # Make API request with the specific LOINC code
-        api_params = {"loinc_code": loinc_code}
         api_result = loinc_api.search_loincs(loinc_code, 1)
         
         # Check for API errors
@@ -370,7 +362,15 @@ def get_loinc_panel(
         if panel_info.get("CLASS") != "PANEL":
             return {"error": f"LOINC code {panel_code} is not a panel"}
     
-    # If we only have a panel name, search for it
+    # If we only have a panel name, match it against the names of the local panels first
+    elif panel_name and use_local_db and loinc_database and loinc_database.loaded and (
+        local_panels := loinc_database.find_panels_by_name(panel_name, limit=1)
+    ):
+        # Records come from the PANEL class bucket and are complete: no class check or detail lookup needed
+        panel_info = local_panels[0]
+        panel_code = panel_info.get("LOINC_NUM")
+    
+    # Otherwise search for it through the full search tool (which falls back to the API)
     elif panel_name:
         search_result = search_loinc_codes(
             query=panel_name,
@@ -398,18 +398,36 @@ def get_loinc_panel(
         logger.error(f"Error fetching panel components: {panel_components_result['error']}")
         return {"error": panel_components_result["error"]}
     
-    components = panel_components_result.get("components", [])
+    components = list(panel_components_result.get("components", []))
     
     # If requested and we have component codes, get the details for each component
     if include_component_details and components:
         logger.info(f"Fetching details for {len(components)} panel components")
         
+        component_codes = [component.get("loinc_code") for component in components if component.get("loinc_code")]
+        
+        # Resolve every component known to the local database with a single batch lookup
+        details_by_code = {}
+        if use_local_db and loinc_database and loinc_database.loaded:
+            details_by_code = loinc_database.get_many_by_code(component_codes)
+        
+        # Only components missing from the local database go through the API, concurrently
+        missing_codes = list(dict.fromkeys(code for code in component_codes if code not in details_by_code))
+        if missing_codes:
+            with ThreadPoolExecutor(max_workers=min(DETAIL_FETCH_WORKERS, len(missing_codes))) as executor:
+                fetched = executor.map(
+                    lambda code: get_loinc_details(code, use_local_db=False, include_answer_list=False),
+                    missing_codes
+                )
+                for code, component_details in zip(missing_codes, fetched):
+                    if "error" not in component_details:
+                        details_by_code[code] = component_details["details"]
+        
+        # Build new component dicts rather than mutating the (possibly cached) API response
         for i, component in enumerate(components):
-            component_code = component.get("loinc_code")
-            if component_code:
-                component_details = get_loinc_details(component_code, use_local_db, False)
-                if "error" not in component_details:
-                    components[i]["details"] = component_details["details"]
+            details = details_by_code.get(component.get("loinc_code"))
+            if details is not None:
+                components[i] = {**component, "details": details}
     
     # Prepare the response
     response = {
@@ -452,20 +470,25 @@ def search_loinc_forms(
         logger.error(f"API Error: {forms_result['error']}")
         return {"error": forms_result["error"]}
     
-    forms = forms_result.get("forms", [])
+    forms = list(forms_result.get("forms", []))
     logger.info(f"Found {len(forms)} forms matching query: {query}")
     
     # If requested and we have forms, get the questions for each form
     if include_questions and forms:
         logger.info(f"Fetching questions for {len(forms)} forms")
         
-        for i, form in enumerate(forms):
-            form_code = form.get("loinc_code")
-            if form_code:
-                # Use the panel endpoint to get the form questions (form is essentially a panel)
-                form_details = get_loinc_panel(panel_code=form_code, include_component_details=True)
-                if "error" not in form_details:
-                    forms[i]["questions"] = form_details.get("components", [])
+        form_indexes = [i for i, form in enumerate(forms) if form.get("loinc_code")]
+        
+        # Use the panel endpoint to get the form questions (form is essentially a panel), one form per worker
+        if form_indexes:
+            with ThreadPoolExecutor(max_workers=min(DETAIL_FETCH_WORKERS, len(form_indexes))) as executor:
+                fetched = executor.map(
+                    lambda i: get_loinc_panel(panel_code=forms[i]["loinc_code"], include_component_details=True),
+                    form_indexes
+                )
+                for i, form_details in zip(form_indexes, fetched):
+                    if "error" not in form_details:
+                        forms[i] = {**forms[i], "questions": form_details.get("components", [])}
     
     # Prepare the response
     response = {
@@ -571,9 +594,12 @@ def test_loinc_api_connection(username: str, password: str) -> None:
         # Try different search terms
         test_terms = ["glucose", "2339-0", "hemoglobin", "lipid panel"]
         
-        for term in test_terms:
+        # The test searches are independent, so run them concurrently and report them in order
+        with ThreadPoolExecutor(max_workers=len(test_terms)) as executor:
+            test_results = list(executor.map(test_api.search_loincs, test_terms))
+        
+        for term, result in zip(test_terms, test_results):
             logger.info(f"Testing API with search term: '{term}'...")
-            result = test_api.search_loincs(term)
             
             if "error" in result:
                 logger.error(f"API Error for '{term}': {result['error']}")
@@ -621,14 +647,14 @@ def main():
     try:
         # Initialize the LOINC database (if file exists)
         if os.path.exists(db_path):
-            loinc_database = initialize_loinc_database(db_path)
+            loinc_database = initialize_loinc_database(db_path, args.index_file)
         else:
             logger.warning(f"Database file not found: {db_path}")
             logger.info("Running in API-only mode")
             loinc_database = None
         
         # Initialize the LOINC API with username and password
-        loinc_api = initialize_loinc_api(args.username, args.password)
+        loinc_api = initialize_loinc_api(args.username, args.password, args.cache_dir)
         
         # Start the MCP server
         logger.info("Starting LOINC API MCP Server")